@@ -1,13 +1,32 @@
 """
 Formal trace logging: every interaction as JSONL.
 Trace: USER_INPUT → MODEL_OUTPUT → WRAPPER_DECISION → ...
+
+Records are queued and written in batches by a single background writer
+(see start_writer / stop_writer); if no writer is running, log_trace writes
+synchronously.
 """
 
+import asyncio
 import json
+import logging
 import os
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+WRITE_BATCH_SIZE = 64
+FLUSH_INTERVAL = 0.05  # seconds
+
+_QUEUE: Optional[asyncio.Queue] = None
+_WRITER: Optional[asyncio.Task] = None
+
+_log = logging.getLogger(__name__)
 
 
 def ensure_log_dir(log_dir: str) -> Path:
@@ -16,10 +35,109 @@ def ensure_log_dir(log_dir: str) -> Path:
     return p
 
 
+def _dumps_line(record: dict) -> bytes:
+    if orjson is not None:
+        # Non-string keys (e.g. int keys in wrapper_config) become strings, as with json
+        return orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _open_append(file_path: Path):
+    try:
+        return open(file_path, "ab", buffering=0)
+    except FileNotFoundError:  # log dir removed at runtime: recreate it
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        return open(file_path, "ab", buffering=0)
+
+
+def _write_batch(handles: dict, batch: List[Tuple[Path, bytes]]) -> None:
+    # One unbuffered O_APPEND write per file per batch, so whole lines from
+    # several worker processes sharing a trace file do not interleave.
+    chunks: dict = {}
+    for file_path, line in batch:
+        chunks.setdefault(file_path, []).append(line)
+    for file_path, lines in chunks.items():
+        f = handles.get(file_path)
+        if f is not None and os.fstat(f.fileno()).st_nlink == 0:
+            # Trace file was deleted since it was opened; start a new one
+            f.close()
+            f = None
+        if f is None:
+            f = _open_append(file_path)
+            handles[file_path] = f
+        data = memoryview(b"".join(lines))
+        while data:
+            data = data[f.write(data):]
+
+
+async def _writer_loop(queue: asyncio.Queue) -> None:
+    """Drain the queue: up to WRITE_BATCH_SIZE records or FLUSH_INTERVAL per write."""
+    loop = asyncio.get_running_loop()
+    handles: dict = {}
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            deadline = loop.time() + FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            # Disk I/O runs on the default thread pool, not the event loop
+            try:
+                await loop.run_in_executor(None, _write_batch, handles, batch)
+            except Exception:
+                # Drop this batch but keep the writer alive for later records
+                _log.exception("Failed to write %d trace record(s)", len(batch))
+                for f in handles.values():
+                    f.close()
+                handles.clear()
+            if stop:
+                break
+    finally:
+        for f in handles.values():
+            f.close()
+
+
+async def start_writer() -> None:
+    """Start the background trace writer on the running event loop."""
+    global _QUEUE, _WRITER
+    if _WRITER is not None:
+        return
+    _QUEUE = asyncio.Queue()
+    _WRITER = asyncio.create_task(_writer_loop(_QUEUE))
+
+
+async def stop_writer() -> None:
+    """Flush all queued records and stop the background writer."""
+    global _QUEUE, _WRITER
+    if _WRITER is None:
+        return
+    if not _WRITER.done():
+        _QUEUE.put_nowait(None)
+    try:
+        await _WRITER
+    except Exception:
+        _log.exception("Trace writer failed")
+    finally:
+        _QUEUE = None
+        _WRITER = None
+
+
 def log_trace(
-    log_path: str,
-    log_dir: str,
-    timestamp: str,
+    trace_path: Path,
+    timestamp_ns: int,
     model_name: str,
     wrapper_name: str,
     wrapper_config: dict,
@@ -32,11 +150,11 @@ def log_trace(
 ) -> None:
     """
     Append one JSONL record for a single run.
+    trace_path's directory must exist (see ensure_log_dir); timestamp_ns is
+    Unix time in nanoseconds (time.time_ns()).
     """
-    dir_path = ensure_log_dir(log_dir)
-    file_path = dir_path / log_path
     record = {
-        "timestamp": timestamp,
+        "timestamp_ns": timestamp_ns,
         "model_name": model_name,
         "wrapper_name": wrapper_name,
         "wrapper_config": wrapper_config,
@@ -47,5 +165,9 @@ def log_trace(
         "total_model_calls": total_model_calls,
         "wrapper_state": wrapper_state,
     }
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    line = _dumps_line(record)
+    if _QUEUE is not None and not _WRITER.done():
+        _QUEUE.put_nowait((trace_path, line))
+        return
+    with _open_append(trace_path) as f:
+        f.write(line)
@@ -2,24 +2,30 @@
 FastAPI entry: black-box model + safety wrappers as finite-state monitors.
 """
 
+import asyncio
+import functools
+import json
 import os
-from datetime import datetime, timezone
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
 
 import uvicorn
-import yaml
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 
 # Load .env from project root so OPENROUTER_API_KEY is available
 _root = Path(__file__).resolve().parent.parent
 load_dotenv(_root / ".env")
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 
-from backend.logging.logger import log_trace
-from backend.models.openrouter_gemini import complete as model_complete
-from backend.wrappers import get_wrapper
+from backend.logging.logger import ensure_log_dir, log_trace, start_writer, stop_writer
+from backend.models.batcher import PromptBatcher
+from backend.models.openrouter_gemini import close_client, complete as model_complete
+from backend.wrappers import WRAPPERS, BaseWrapper, get_wrapper
 from backend.wrappers.base import Action
 
 app = FastAPI(title="Safety Wrappers Research API")
@@ -30,21 +36,103 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=512)
 
-_CONFIG: dict = {}
+# config path -> (mtime_ns, size, parsed config); small LRU
+_CONFIG: "OrderedDict[Path, tuple[int, int, dict]]" = OrderedDict()
+_CONFIG_CACHE_SIZE = 4
+DISCONNECT_POLL_INTERVAL = 0.5  # seconds
 
 
-def load_config() -> dict:
-    global _CONFIG
-    if _CONFIG:
-        return _CONFIG
-    root = Path(__file__).resolve().parent.parent
-    config_path = Path(__file__).resolve().parent / "config" / "config.yaml"
+@app.on_event("startup")
+async def _startup() -> None:
+    await start_writer()
+    cfg = load_config()
+    app.state.runtime_cfg = cfg
+    app.state.runtime = _build_runtime(cfg)
+    batching = cfg.get("batching", {})
+    app.state.batcher = PromptBatcher(
+        model_complete,
+        max_batch_size=int(batching.get("max_batch_size", 8)),
+        max_latency_ms=float(batching.get("max_latency_ms", 0)),
+    )
+    await app.state.batcher.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    await app.state.batcher.stop()
+    await stop_writer()
+    await close_client()
+
+
+def _config_path() -> Path:
+    config_path = _root / "backend" / "config" / "config.yaml"
     if not config_path.exists():
-        config_path = root / "config" / "config.yaml"
-    with open(config_path, "r", encoding="utf-8") as f:
-        _CONFIG = yaml.safe_load(f)
-    return _CONFIG
+        config_path = _root / "config" / "config.yaml"
+    return config_path
+
+
+# Resolved once; load_config only stat()s it to detect edits
+_CONFIG_PATH = _config_path()
+
+
+def _write_json_sidecar(json_path: Path, st: os.stat_result, cfg: dict) -> None:
+    """
+    Write config.yaml.json atomically so later cold starts can skip YAML.
+    The sidecar records the YAML's (mtime_ns, size) it was built from; it is
+    skipped when the config does not survive a JSON round trip unchanged
+    (e.g. YAML dates or non-string keys).
+    """
+    try:
+        data = json.dumps({"mtime_ns": st.st_mtime_ns, "size": st.st_size, "config": cfg})
+        if json.loads(data)["config"] != cfg:
+            return
+    except (TypeError, ValueError):
+        return
+    # Per-process temp name: workers starting together must not share it
+    tmp = json_path.with_name(f"{json_path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, json_path)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def load_config() -> dict:
+    config_path = _CONFIG_PATH
+    st = config_path.stat()
+    cached = _CONFIG.get(config_path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        _CONFIG.move_to_end(config_path)
+        return cached[2]
+
+    # A sidecar built from exactly this YAML (same mtime and size) is
+    # authoritative: json.loads is far cheaper than yaml.safe_load, and PyYAML
+    # is then never imported.
+    json_path = config_path.with_suffix(".yaml.json")
+    cfg = None
+    try:
+        sidecar = json.loads(json_path.read_bytes())
+        if sidecar["mtime_ns"] == st.st_mtime_ns and sidecar["size"] == st.st_size:
+            cfg = sidecar["config"]
+    except (OSError, ValueError, TypeError, KeyError):
+        cfg = None
+    if not isinstance(cfg, dict):
+        import yaml  # only needed when the JSON sidecar is missing or stale
+
+        with open(config_path, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f)
+        _write_json_sidecar(json_path, st, cfg)
+
+    _CONFIG[config_path] = (st.st_mtime_ns, st.st_size, cfg)
+    _CONFIG.move_to_end(config_path)
+    while len(_CONFIG) > _CONFIG_CACHE_SIZE:
+        _CONFIG.popitem(last=False)
+    return cfg
 
 
 class QueryRequest(BaseModel):
@@ -73,22 +161,98 @@ def get_wrapper_config(cfg: dict, wrapper_name: str) -> dict:
     return {}
 
 
-@app.post("/query", response_model=QueryResponse)
-async def query(req: QueryRequest):
-    cfg = load_config()
-    model_name = cfg.get("model", {}).get("name", "google/gemini-2.5-flash-lite")
-    base_url = cfg.get("openrouter", {}).get("base_url", "https://openrouter.ai/api/v1")
-    api_key = os.environ.get("OPENROUTER_API_KEY")
-    wrapper_name = req.wrapper_name or cfg.get("wrappers", {}).get("default", "noop")
+@dataclass(frozen=True, slots=True)
+class QueryPlan:
+    """Per-wrapper settings resolved once from config."""
+
+    # Prebuilt; fork() reuses it only for stateless wrappers (noop, keyword)
+    # and builds a fresh instance per run for the rest
+    wrapper: BaseWrapper
+    wrapper_config: dict
+    max_calls: int  # default model-call budget
+    user_limit: bool  # honour QueryRequest.max_queries (1–10)
+    precheck: bool  # check the prompt before any model call
+    concurrent: bool  # re-queries are independent and may run in parallel
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeConfig:
+    """Everything query() needs from config, resolved once per loaded config."""
+
+    model_name: str
+    base_url: str
+    default_wrapper: str
+    trace_path: Path  # log dir resolved against the project root and created
+    stream: bool
+    plans: dict[str, QueryPlan]
+
+
+def _build_plan(cfg: dict, wrapper_name: str) -> QueryPlan:
     wrapper_config = get_wrapper_config(cfg, wrapper_name)
+    max_queries = int(cfg.get("wrappers", {}).get("query_budget", {}).get("max_queries", 2))
+    history_k = cfg.get("wrappers", {}).get("history", {}).get("k", 3)
+    if wrapper_name == "query_budget":
+        max_calls = int(wrapper_config.get("max_queries", max_queries))
+    elif wrapper_name == "history":
+        max_calls = max(max_queries, int(wrapper_config.get("k", history_k)) + 2)
+    else:
+        max_calls = max_queries
+    return QueryPlan(
+        wrapper=get_wrapper(wrapper_name, wrapper_config),
+        wrapper_config=wrapper_config,
+        max_calls=max_calls,
+        user_limit=wrapper_name == "query_budget",
+        precheck=wrapper_name == "keyword",
+        concurrent=wrapper_name == "history" and bool(wrapper_config.get("concurrent", False)),
+    )
+
+
+def _build_runtime(cfg: dict) -> RuntimeConfig:
     log_cfg = cfg.get("logging", {})
-    log_dir = log_cfg.get("log_dir", "logs")
-    trace_file = log_cfg.get("trace_file", "traces.jsonl")
+    # Resolve log_dir relative to project root; created once here, not per request
+    log_dir = ensure_log_dir(str(_root / log_cfg.get("log_dir", "logs")))
+    return RuntimeConfig(
+        model_name=cfg.get("model", {}).get("name", "google/gemini-2.5-flash-lite"),
+        base_url=cfg.get("openrouter", {}).get("base_url", "https://openrouter.ai/api/v1"),
+        default_wrapper=cfg.get("wrappers", {}).get("default", "noop"),
+        trace_path=log_dir / log_cfg.get("trace_file", "traces.jsonl"),
+        stream=bool(cfg.get("openrouter", {}).get("stream", True)),
+        plans={name: _build_plan(cfg, name) for name in WRAPPERS},
+    )
+
+
+def get_runtime() -> RuntimeConfig:
+    """Runtime config for the current config.yaml; rebuilt only when it reloads."""
+    cfg = load_config()
+    if app.state.runtime_cfg is not cfg:
+        app.state.runtime = _build_runtime(cfg)
+        app.state.runtime_cfg = cfg
+    return app.state.runtime
+
+
+async def _wait_disconnect(request: Request) -> None:
+    # Starlette's is_disconnected() does not block, so poll it
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
 
-    # Resolve log_dir relative to project root
-    root = Path(__file__).resolve().parent.parent
-    log_dir_abs = root / log_dir
-    log_dir_abs.mkdir(parents=True, exist_ok=True)
+
+async def _first_completed(aws: set, disconnected: asyncio.Task) -> set:
+    """asyncio.wait(FIRST_COMPLETED) that cancels aws and aborts if the client disconnects."""
+    done, _ = await asyncio.wait(aws | {disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    if disconnected in done:
+        for t in aws:
+            t.cancel()
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    return done
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(req: QueryRequest, request: Request):
+    rt = get_runtime()
+    model_name = rt.model_name
+    base_url = rt.base_url
+    api_key = os.environ.get("OPENROUTER_API_KEY")
+    wrapper_name = req.wrapper_name or rt.default_wrapper
 
     # Empty prompt handling: no model call, no safety decision
     prompt = (req.prompt or "").strip()
@@ -102,31 +266,26 @@ async def query(req: QueryRequest):
             decisions_sequence=[],
         )
 
-    wrapper = get_wrapper(wrapper_name, wrapper_config)
-    wrapper.reset()
+    plan = rt.plans.get(wrapper_name)
+    if plan is None:
+        raise ValueError(f"Unknown wrapper: {wrapper_name}")
+    wrapper_config = plan.wrapper_config
+    wrapper = plan.wrapper.fork()
 
-    max_queries = cfg.get("wrappers", {}).get("query_budget", {}).get("max_queries", 2)
-    history_k = cfg.get("wrappers", {}).get("history", {}).get("k", 3)
-    if wrapper_name == "query_budget":
-        user_limit = req.max_queries
-        if user_limit is not None and 1 <= user_limit <= 10:
-            max_calls = user_limit
-        else:
-            max_calls = int(wrapper_config.get("max_queries", max_queries))
-    elif wrapper_name == "history":
-        max_calls = max(int(max_queries), int(wrapper_config.get("k", history_k)) + 2)
-    else:
-        max_calls = int(max_queries)
+    max_calls = plan.max_calls
+    if plan.user_limit and req.max_queries is not None and 1 <= req.max_queries <= 10:
+        max_calls = req.max_queries
 
     # Keyword: pre-check prompt before calling model (block harmful prompts with 0 API calls)
-    if wrapper_name == "keyword":
+    prompt_allowed = False
+    if plan.precheck:
         pre_action, pre_output = wrapper.step(prompt, "", 0)
+        # The verdict depends on the prompt only, so an ALLOW here stands for every call
+        prompt_allowed = pre_action == Action.ALLOW
         if pre_action == Action.BLOCK:
-            timestamp = datetime.now(timezone.utc).isoformat()
             log_trace(
-                log_path=trace_file,
-                log_dir=str(log_dir_abs),
-                timestamp=timestamp,
+                trace_path=rt.trace_path,
+                timestamp_ns=time.time_ns(),
                 model_name=model_name,
                 wrapper_name=wrapper_name,
                 wrapper_config=wrapper_config,
@@ -150,46 +309,130 @@ async def query(req: QueryRequest):
     decisions_sequence: list[str] = []
     final_output = ""
     call_index = 0
-
-    while call_index < max_calls:
-        try:
-            out = await model_complete(
-                prompt,
-                model_name=model_name,
-                base_url=base_url,
-                api_key=api_key,
-            )
-        except Exception as e:
-            raise HTTPException(status_code=502, detail=str(e))
-
-        raw_outputs.append(out)
-        action, output_to_use = wrapper.step(prompt, out, call_index)
-        decisions_sequence.append(action.value)
-
-        if action == Action.ALLOW:
-            final_output = output_to_use
-            break
-        if action == Action.BLOCK:
-            final_output = output_to_use
-            break
-        if action == Action.MODIFY:
-            final_output = output_to_use
-            break
-        if action == Action.REQUERY:
-            call_index += 1
-            if call_index >= max_calls:
-                final_output = raw_outputs[-1] if raw_outputs else ""
-                break
-            continue
+    calls_issued = 0  # upstream calls sent, including cancelled concurrent ones
+
+    # Cancel in-flight model calls if the client goes away mid-request
+    disconnected = asyncio.create_task(_wait_disconnect(request))
+    try:
+        if plan.concurrent and max_calls > 1:
+            # History only re-queries on empty/duplicate output, so the calls are
+            # independent: run them concurrently, keep the first ALLOW, cancel the rest.
+            # When streaming, the first call to produce non-empty text is certain to
+            # be allowed (the buffer is still empty), so the rest are cancelled then.
+            tasks: list[asyncio.Task] = []
+            claimed = False
+
+            def claim(winner: int) -> None:
+                nonlocal claimed
+                if claimed:
+                    return
+                claimed = True
+                for i, t in enumerate(tasks):
+                    if i != winner:
+                        t.cancel()
+
+            for i in range(max_calls):
+                on_content = functools.partial(claim, i) if rt.stream else None
+                tasks.append(
+                    asyncio.create_task(
+                        app.state.batcher.submit(
+                            prompt,
+                            model_name=model_name,
+                            base_url=base_url,
+                            api_key=api_key,
+                            stream=rt.stream,
+                            on_content=on_content,
+                        )
+                    )
+                )
+            calls_issued = len(tasks)
+            pending = set(tasks)
+            decided = False
+            error = None
+            try:
+                while pending and not decided:
+                    done = await _first_completed(pending, disconnected)
+                    pending -= done
+                    for t in done:
+                        if t.cancelled():
+                            continue
+                        if t.exception() is not None:
+                            # Another call may still succeed; fail only if none does
+                            error = t.exception()
+                            continue
+
+                        out = t.result()
+                        raw_outputs.append(out)
+                        action, output_to_use = wrapper.step(prompt, out, call_index)
+                        decisions_sequence.append(action.value)
+                        call_index += 1
+                        if action != Action.REQUERY:
+                            final_output = output_to_use
+                            decided = True
+                            break
+                if not decided:
+                    if not raw_outputs and error is not None:
+                        raise HTTPException(status_code=502, detail=str(error))
+                    final_output = raw_outputs[-1] if raw_outputs else ""
+            finally:
+                for t in tasks:
+                    t.cancel()
+        else:
+            while call_index < max_calls:
+                call = asyncio.create_task(
+                    app.state.batcher.submit(
+                        prompt,
+                        model_name=model_name,
+                        base_url=base_url,
+                        api_key=api_key,
+                    )
+                )
+                calls_issued += 1
+                await _first_completed({call}, disconnected)
+                try:
+                    out = call.result()
+                except Exception as e:
+                    raise HTTPException(status_code=502, detail=str(e))
+
+                raw_outputs.append(out)
+                if prompt_allowed:
+                    action, output_to_use = Action.ALLOW, out
+                else:
+                    action, output_to_use = wrapper.step(prompt, out, call_index)
+                decisions_sequence.append(action.value)
+
+                if action == Action.ALLOW:
+                    final_output = output_to_use
+                    break
+                if action == Action.BLOCK:
+                    final_output = output_to_use
+                    break
+                if action == Action.MODIFY:
+                    final_output = output_to_use
+                    break
+                if action == Action.REQUERY:
+                    call_index += 1
+                    if call_index >= max_calls:
+                        final_output = raw_outputs[-1] if raw_outputs else ""
+                        break
+                    continue
+
+    finally:
+        disconnected.cancel()
 
     last_decision = decisions_sequence[-1] if decisions_sequence else Action.ALLOW.value
-    num_calls = len(raw_outputs)
+    num_calls = calls_issued
     if wrapper_name == "keyword" and last_decision == Action.BLOCK.value:
         decision_summary = "Blocked: your prompt contained a banned or harmful keyword."
     elif wrapper_name == "keyword" and last_decision == Action.ALLOW.value:
         decision_summary = "Allowed: no banned keywords detected in your prompt."
     elif wrapper_name == "noop":
         decision_summary = "No filter applied (baseline). Response was not checked for safety."
+    elif wrapper_name == "history" and plan.concurrent:
+        if Action.REQUERY.value in decisions_sequence:
+            decision_summary = f"History: re-queried due to empty or duplicate output; allowed after {len(raw_outputs)} response(s), {num_calls} call(s) issued."
+        else:
+            decision_summary = f"History: first response allowed (no empty or duplicate); {num_calls} call(s) issued."
     elif wrapper_name == "history":
         if Action.REQUERY.value in decisions_sequence:
             decision_summary = f"History: re-queried due to empty or duplicate output; allowed after {num_calls} call(s)."
@@ -200,11 +443,9 @@ async def query(req: QueryRequest):
     else:
         decision_summary = f"Decision: {last_decision}."
 
-    timestamp = datetime.now(timezone.utc).isoformat()
     log_trace(
-        log_path=trace_file,
-        log_dir=str(log_dir_abs),
-        timestamp=timestamp,
+        trace_path=rt.trace_path,
+        timestamp_ns=time.time_ns(),
         model_name=model_name,
         wrapper_name=wrapper_name,
         wrapper_config=wrapper_config,
@@ -212,7 +453,7 @@ async def query(req: QueryRequest):
         raw_model_outputs=raw_outputs,
         wrapper_decisions=decisions_sequence,
         final_output=final_output,
-        total_model_calls=len(raw_outputs),
+        total_model_calls=num_calls,
         wrapper_state=wrapper.get_state(),
     )
 
@@ -220,7 +461,7 @@ async def query(req: QueryRequest):
         final_output=final_output,
         wrapper_decision=last_decision,
         decision_summary=decision_summary,
-        model_call_count=len(raw_outputs),
+        model_call_count=num_calls,
         raw_outputs=raw_outputs,
         decisions_sequence=decisions_sequence,
     )
@@ -255,5 +496,14 @@ async def get_config():
 
 
 if __name__ == "__main__":
-    load_config()
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    server = load_config().get("server", {})
+    workers = int(server.get("workers", 1)) or os.cpu_count() or 1
+    uvicorn.run(
+        # Import string so uvicorn can spawn worker processes
+        "backend.main:app" if workers > 1 else app,
+        host=server.get("host", "0.0.0.0"),
+        port=int(server.get("port", 8000)),
+        loop=server.get("loop", "auto"),
+        http=server.get("http", "auto"),
+        workers=workers,
+    )
@@ -0,0 +1,113 @@
+"""
+Micro-batcher in front of the model backend.
+Prompts submitted within a short window are dispatched together; OpenRouter has
+no multi-prompt chat endpoint, so a batch is issued as concurrent calls on the
+shared client.
+"""
+
+import asyncio
+import functools
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+CompleteFn = Callable[..., Awaitable[str]]
+
+
+class PromptBatcher:
+    """
+    Collects (prompt, kwargs) submissions for up to max_latency_ms or until
+    max_batch_size accumulate, then dispatches the batch with asyncio.gather.
+    With max_latency_ms == 0 it is disabled and submit() calls complete_fn directly.
+    """
+
+    def __init__(
+        self,
+        complete_fn: CompleteFn,
+        max_batch_size: int = 8,
+        max_latency_ms: float = 20.0,
+    ):
+        self._complete = complete_fn
+        self._max_batch_size = max(1, int(max_batch_size))
+        self._max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self._collector is not None or self._max_latency <= 0:
+            return
+        self._queue = asyncio.Queue()
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self) -> None:
+        if self._collector is None:
+            return
+        self._queue.put_nowait(None)
+        await self._collector
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._queue = None
+        self._collector = None
+
+    async def submit(self, prompt: str, **kwargs) -> str:
+        """Queue one completion and wait for its result."""
+        if self._queue is None:
+            return await self._complete(prompt, **kwargs)
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((prompt, kwargs, fut))
+        return await fut
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = loop.time() + self._max_latency
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            # Dispatch without awaiting so the next window starts collecting now
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            if stop:
+                return
+
+    async def _run_batch(self, batch: List[Tuple[str, dict, asyncio.Future]]) -> None:
+        tasks = []
+        for prompt, kwargs, fut in batch:
+            if fut.done():  # caller gave up while queued
+                continue
+            task = asyncio.ensure_future(self._complete(prompt, **kwargs))
+            task.add_done_callback(functools.partial(_resolve, fut))
+            # Cancelling the caller's await cancels the upstream call too
+            fut.add_done_callback(functools.partial(_cancel_if_cancelled, task))
+            tasks.append(task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _resolve(fut: asyncio.Future, task: asyncio.Task) -> None:
+    if fut.done():
+        return
+    if task.cancelled():
+        fut.cancel()
+    elif task.exception() is not None:
+        fut.set_exception(task.exception())
+    else:
+        fut.set_result(task.result())
+
+
+def _cancel_if_cancelled(task: asyncio.Task, fut: asyncio.Future) -> None:
+    if fut.cancelled():
+        task.cancel()
@@ -3,20 +3,51 @@ Black-box model backend: Gemini 2.5 Flash Lite via OpenRouter.
 No assumptions about internals; API only.
 """
 
+import json
 import os
-from typing import Optional
+from typing import Callable, Optional
 
 import httpx
 
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared pooled client: keeps TCP/TLS connections alive across calls."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(
+            timeout=60.0,
+            limits=httpx.Limits(
+                max_keepalive_connections=32,
+                max_connections=64,
+                keepalive_expiry=60,
+            ),
+            http2=True,
+        )
+    return _CLIENT
+
+
+async def close_client() -> None:
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
 
 async def complete(
     prompt: str,
     model_name: str,
     base_url: str,
     api_key: Optional[str] = None,
+    stream: bool = False,
+    on_content: Optional[Callable[[], None]] = None,
 ) -> str:
     """
     Single completion call. Pure black-box: send prompt, receive text.
+    With stream=True the response is read as server-sent events and
+    on_content() is called once, as soon as non-whitespace text arrives;
+    cancelling the call then closes the stream and stops the generation.
     """
     key = api_key or os.environ.get("OPENROUTER_API_KEY")
     if not key:
@@ -34,13 +65,52 @@ async def complete(
         "HTTP-Referer": "https://safety-wrappers-research.local",
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+    if stream:
+        payload["stream"] = True
+        return await _read_stream(url, payload, headers, on_content)
+
+    resp = await get_client().post(url, json=payload, headers=headers)
+    resp.raise_for_status()
+    data = resp.json()
 
     choices = data.get("choices", [])
     if not choices:
         return ""
     content = choices[0].get("message", {}).get("content", "")
     return content if isinstance(content, str) else str(content)
+
+
+async def _read_stream(
+    url: str,
+    payload: dict,
+    headers: dict,
+    on_content: Optional[Callable[[], None]],
+) -> str:
+    parts: list = []
+    async with get_client().stream("POST", url, json=payload, headers=headers) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            # SSE: "data: {...}" events; ":"-prefixed lines are keep-alive comments
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            # A mid-stream failure arrives as an event with an "error" object
+            # after the 200 headers; never return the partial text as a success
+            error = event.get("error")
+            if error:
+                message = error.get("message", error) if isinstance(error, dict) else error
+                raise RuntimeError(f"OpenRouter stream error: {message}")
+            choices = event.get("choices", [])
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if not delta:
+                continue
+            parts.append(delta if isinstance(delta, str) else str(delta))
+            if on_content is not None and parts[-1].strip():
+                on_content()
+                on_content = None
+    return "".join(parts)
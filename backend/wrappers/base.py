@@ -24,6 +24,10 @@ class BaseWrapper(ABC):
     def __init__(self, config: dict):
         self.config = config or {}
 
+    def fork(self) -> "BaseWrapper":
+        """Instance for a single run; stateful wrappers must not be shared across requests."""
+        return type(self)(self.config)
+
     @abstractmethod
     def reset(self) -> None:
         """Reset internal state for a new run."""
@@ -3,12 +3,16 @@ History-based wrapper: bounded history of length k.
 REQUERY if model output is empty or duplicate of recent; else ALLOW.
 """
 
+import hashlib
+from collections import deque
+
 from backend.wrappers.base import BaseWrapper, Action
 
 
 class HistoryWrapper(BaseWrapper):
     """
-    State: buffer of last k model outputs (bounded history).
+    State: buffer of last k model outputs (bounded history), kept as short
+    SHA-1 digests; the outputs themselves are already in the trace.
     Observed events: user_prompt, model_output, call_index.
     Actions: REQUERY if output empty or in history (up to budget); else ALLOW.
     """
@@ -18,10 +22,12 @@ class HistoryWrapper(BaseWrapper):
     def __init__(self, config: dict):
         super().__init__(config)
         self._k = int(self.config.get("k", 3))
-        self._buffer: list = []
+        self._buffer: deque = deque(maxlen=max(self._k, 0))
+        self._seen: set = set()  # mirrors _buffer for O(1) membership
 
     def reset(self) -> None:
-        self._buffer = []
+        self._buffer.clear()
+        self._seen.clear()
 
     def step(
         self,
@@ -32,12 +38,16 @@ class HistoryWrapper(BaseWrapper):
         out_stripped = (model_output or "").strip()
         if not out_stripped:
             return Action.REQUERY, ""
-        if out_stripped in self._buffer:
+        digest = hashlib.sha1(out_stripped.encode("utf-8")).hexdigest()[:16]
+        if digest in self._seen:
             return Action.REQUERY, ""
-        self._buffer.append(out_stripped)
-        if len(self._buffer) > self._k:
-            self._buffer.pop(0)
+        if len(self._buffer) == self._buffer.maxlen:
+            if not self._buffer:
+                return Action.ALLOW, model_output
+            self._seen.discard(self._buffer[0])
+        self._buffer.append(digest)
+        self._seen.add(digest)
         return Action.ALLOW, model_output
 
     def get_state(self) -> dict:
-        return {"k": self._k, "buffer": list(self._buffer)}
+        return {"k": self._k, "buffer_sha1": list(self._buffer)}
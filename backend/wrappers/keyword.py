@@ -2,6 +2,8 @@
 Keyword-based wrapper: block if prompt contains banned keywords.
 """
 
+import re
+
 from backend.wrappers.base import BaseWrapper, Action
 
 
@@ -20,6 +22,16 @@ class KeywordWrapper(BaseWrapper):
         self._keywords = [
             k.lower() for k in self.config.get("banned_keywords", [])
         ]
+        # One alternation for all keywords: a single scan per prompt.
+        # No word boundaries, so matching stays substring-based ("hacking" hits "hack").
+        self._pattern = (
+            re.compile("|".join(map(re.escape, self._keywords)), re.IGNORECASE)
+            if self._keywords
+            else None
+        )
+
+    def fork(self) -> "BaseWrapper":
+        return self
 
     def reset(self) -> None:
         pass
@@ -30,10 +42,8 @@ class KeywordWrapper(BaseWrapper):
         model_output: str,
         call_index: int,
     ) -> tuple:
-        prompt_lower = user_prompt.lower()
-        for kw in self._keywords:
-            if kw in prompt_lower:
-                return Action.BLOCK, self.BLOCK_MESSAGE
+        if self._pattern is not None and self._pattern.search(user_prompt):
+            return Action.BLOCK, self.BLOCK_MESSAGE
         return Action.ALLOW, model_output
 
     def get_state(self) -> dict:
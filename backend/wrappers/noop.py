@@ -14,6 +14,9 @@ class NoopWrapper(BaseWrapper):
 
     name = "noop"
 
+    def fork(self) -> "BaseWrapper":
+        return self
+
     def reset(self) -> None:
         pass
 
@@ -11,50 +11,57 @@ from pathlib import Path
 import matplotlib.pyplot as plt
 import pandas as pd
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # stdlib json fallback
+    _loads = json.loads
+
 ROOT = Path(__file__).resolve().parent.parent
 LOG_DIR = ROOT / "logs"
 TRACE_FILE = "traces.jsonl"
 
 
-def load_traces(log_dir: Path) -> list:
-    path = log_dir / TRACE_FILE
-    if not path.exists():
-        return []
-    records = []
-    with open(path, "r", encoding="utf-8") as f:
+def _iter_records(path: Path):
+    with open(path, "rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                records.append(json.loads(line))
-            except json.JSONDecodeError:
+                yield _loads(line)
+            except ValueError:  # malformed JSON or bad UTF-8
                 continue
-    return records
 
 
-def is_risky_prompt(prompt: str, risky_path: Path) -> bool:
-    if not risky_path.exists():
-        return False
-    with open(risky_path, "r", encoding="utf-8") as f:
-        risky = set(p.strip().lower() for p in json.load(f))
-    return prompt.strip().lower() in risky
+def load_traces(log_dir: Path) -> pd.DataFrame:
+    """Parse traces.jsonl straight into a DataFrame (malformed lines skipped)."""
+    path = log_dir / TRACE_FILE
+    if not path.exists():
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(_iter_records(path))
 
 
-def is_blocked(record: dict) -> bool:
-    decisions = record.get("wrapper_decisions", [])
-    return "BLOCK" in decisions
+def blocked_mask(df: pd.DataFrame) -> pd.Series:
+    """True for rows whose wrapper_decisions contain BLOCK (vectorized via explode)."""
+    if "wrapper_decisions" not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df["wrapper_decisions"].explode().eq("BLOCK").groupby(level=0).any()
 
 
 def main():
     risky_path = ROOT / "data" / "risky_prompts.json"
-    records = load_traces(LOG_DIR)
-    if not records:
+    df = load_traces(LOG_DIR)
+    if df.empty:
         print("No traces found in logs/traces.jsonl. Run experiments first.")
         sys.exit(0)
 
-    df = pd.DataFrame(records)
-    df["blocked"] = df.apply(is_blocked, axis=1)
+    if "timestamp_ns" in df.columns:
+        ts = pd.to_datetime(df["timestamp_ns"], unit="ns", utc=True)
+        if "timestamp" in df.columns:  # older records carry an ISO timestamp instead
+            ts = ts.fillna(pd.to_datetime(df["timestamp"], utc=True, format="ISO8601"))
+        df["timestamp"] = ts
+    df["blocked"] = blocked_mask(df)
     if "total_model_calls" not in df.columns:
         df["total_model_calls"] = 0
     df["non_empty"] = df["final_output"].fillna("").astype(str).str.strip().str.len() > 0
@@ -15,6 +15,8 @@ sys.path.insert(0, str(ROOT))
 import httpx
 
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
+# Max in-flight /query requests against the backend
+CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "16"))
 
 
 def load_prompts(path: Path) -> list:
@@ -43,15 +45,26 @@ async def main():
     benign = load_prompts(benign_path)
     wrappers = ["noop", "keyword", "history", "query_budget"]
 
-    async with httpx.AsyncClient() as client:
-        for label, prompts in [("risky", risky), ("benign", benign)]:
-            for wrapper in wrappers:
-                for i, prompt in enumerate(prompts):
-                    try:
-                        out = await run_one(client, prompt, wrapper)
-                        print(f"{label} {wrapper} [{i}] calls={out.get('model_call_count', 0)}")
-                    except Exception as e:
-                        print(f"{label} {wrapper} [{i}] error: {e}")
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def _run(label: str, wrapper: str, i: int, prompt: str) -> None:
+        async with sem:
+            try:
+                out = await run_one(client, prompt, wrapper)
+                print(f"{label} {wrapper} [{i}] calls={out.get('model_call_count', 0)}")
+            except Exception as e:
+                print(f"{label} {wrapper} [{i}] error: {e}")
+
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits) as client:
+        await asyncio.gather(
+            *[
+                _run(label, wrapper, i, prompt)
+                for label, prompts in [("risky", risky), ("benign", benign)]
+                for wrapper in wrappers
+                for i, prompt in enumerate(prompts)
+            ]
+        )
 
     print("Batch done. Check logs/ for traces.jsonl.")
 
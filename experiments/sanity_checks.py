@@ -62,7 +62,7 @@ def test_logs_written_correctly():
         lines = [l.strip() for l in f if l.strip()]
     assert lines, "traces.jsonl is empty"
     last = json.loads(lines[-1])
-    required = ["timestamp", "model_name", "wrapper_name", "wrapper_config", "user_prompt", "raw_model_outputs", "wrapper_decisions", "final_output", "total_model_calls"]
+    required = ["timestamp_ns", "model_name", "wrapper_name", "wrapper_config", "user_prompt", "raw_model_outputs", "wrapper_decisions", "final_output", "total_model_calls"]
     for k in required:
         assert k in last, f"Log entry missing key: {k}"
     print("PASS: logs written correctly (JSONL, required keys present)")
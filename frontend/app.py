@@ -3,91 +3,374 @@ Flask frontend: dashboard for Safety Wrappers research.
 Talks to FastAPI backend via HTTP.
 """
 
+import atexit
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.parse import urljoin
+from typing import Optional, Union
 
+import msgspec
+import orjson
 import requests
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, jsonify, make_response, render_template, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Load .env from project root (parent of frontend/)
 _env_dir = Path(__file__).resolve().parent.parent
 load_dotenv(_env_dir / ".env")
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON (jsonify, request.get_json) backed by orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Compress responses to the browser (LLM output is text-heavy). Streamed
+# responses such as the /query relay use their own algorithm list.
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_ALGORITHM_STREAMING"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 512
+app.config["COMPRESS_BR_LEVEL"] = 4
+app.config["COMPRESS_LEVEL"] = 4  # gzip
+Compress(app)
+
+# One pooled session for all backend calls: keep-alive instead of a new
+# connection per request. Retries cover transient gateway errors only.
+# All calls go to one host; the pool is sized for every concurrent request
+# (gevent worker_connections, see gunicorn.conf.py) so it never has to discard
+# connections (urllib3 logs "Connection pool is full" if it does).
+WORKER_CONNECTIONS = int(os.environ.get("WORKER_CONNECTIONS", "1000"))
+SESSION = requests.Session()
+# Backend responses may be compressed too; requests decodes them transparently
+SESSION.headers.update({"Connection": "keep-alive", "Accept": "application/json", "Accept-Encoding": "gzip, br"})
+_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=max(50, 2 * WORKER_CONNECTIONS),
+    pool_block=False,
+    # connect=0: an unreachable backend fails after one connect timeout, not three
+    max_retries=Retry(total=2, connect=0, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+atexit.register(SESSION.close)
+
+# Runs independent backend calls from one handler in parallel
+_IO_POOL = ThreadPoolExecutor(max_workers=4)
+atexit.register(_IO_POOL.shutdown, wait=False)
+
+
+def _env_timeout(name: str, default: tuple) -> tuple:
+    """(connect, read) seconds; override with e.g. HTTP_TIMEOUT_QUERY="5,120"."""
+    raw = os.environ.get(f"HTTP_TIMEOUT_{name.upper()}")
+    if not raw:
+        return default
+    connect, read = (float(x) for x in raw.split(","))
+    return connect, read
+
+
+# Per-endpoint (connect, read) timeouts: a dead backend fails within the short
+# connect budget while slow model responses still get the full read budget.
+HTTP_TIMEOUTS = {
+    "wrappers": _env_timeout("wrappers", (2.0, 5.0)),
+    "config": _env_timeout("config", (2.0, 5.0)),
+    "query": _env_timeout("query", (5.0, 120.0)),
+}
+
+
+class _CircuitBreaker:
+    """
+    Opens after `threshold` consecutive connect timeouts within `window`
+    seconds; while open (for `cooldown` seconds) calls fail immediately.
+    """
+
+    def __init__(self, threshold: int = 3, window: float = 10.0, cooldown: float = 10.0):
+        self._threshold = threshold
+        self._window = window
+        self._cooldown = cooldown
+        self._failures: list = []
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        return time.monotonic() >= self._open_until
 
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures.clear()
 
-def _backend_url(path: str) -> str:
-    base = (os.environ.get("BACKEND_URL") or "http://127.0.0.1:8000").strip().rstrip("/")
-    return urljoin(base + "/", path.lstrip("/"))
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._failures = [t for t in self._failures if now - t < self._window]
+            self._failures.append(now)
+            if len(self._failures) >= self._threshold:
+                self._open_until = now + self._cooldown
+                self._failures.clear()
 
 
-_DEFAULT_WRAPPERS = [
+_BREAKER = _CircuitBreaker()
+
+
+def _backend_call(method: str, url: str, endpoint: str, *, count_failure: bool = True, **kwargs) -> requests.Response:
+    """
+    SESSION request with the endpoint's timeouts, guarded by the circuit breaker.
+    Only connect timeouts count towards opening it (a refused connection already
+    fails fast); pass count_failure=False for calls made alongside a counted one,
+    so each page load or query counts at most once.
+    """
+    if not _BREAKER.allow():
+        raise requests.ConnectionError("backend unreachable (circuit open)")
+    try:
+        r = SESSION.request(method, url, timeout=HTTP_TIMEOUTS[endpoint], **kwargs)
+    except requests.ConnectTimeout:
+        if count_failure:
+            _BREAKER.record_failure()
+        raise
+    _BREAKER.record_success()
+    return r
+
+
+# Backend base URL is fixed for the process: resolve it and the endpoints once
+_BASE = (os.environ.get("BACKEND_URL") or "http://127.0.0.1:8000").strip().rstrip("/") + "/"
+WRAPPERS_URL = _BASE + "wrappers"
+CONFIG_URL = _BASE + "config"
+QUERY_URL = _BASE + "query"
+
+
+# Fallbacks are built once and shared; never mutate them.
+_DEFAULT_WRAPPERS = (
     {"id": "noop", "label": "No filter (baseline)", "description": "No safety check. Use to compare with other options."},
     {"id": "keyword", "label": "Block harmful keywords", "description": "Blocks prompts containing banned words (e.g. bomb, hack, weapon). Best for stopping obviously harmful requests."},
     {"id": "history", "label": "History-based", "description": "Avoids empty or repeated answers by re-asking the model (bounded history)."},
     {"id": "query_budget", "label": "Query budget", "description": "Limits how many times the model is called per request. Useful for cost control."},
-]
+)
+# Backend sent an empty list: plain entries for the known wrapper ids
+_PLAIN_DEFAULT_WRAPPERS = tuple(
+    {"id": w, "label": w, "description": ""} for w in ("noop", "keyword", "history", "query_budget")
+)
+
+
+# Backend /wrappers and /config change rarely: keep them in memory for CACHE_TTL
+# seconds. Only successful fetches are cached, so a backend that is still
+# starting up is retried on the next page load.
+CACHE_TTL = 60.0
+_cache: dict = {}
+
+
+def _cached(key, ttl: float, fn):
+    now = time.monotonic()
+    hit = _cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    value = fn()
+    _cache[key] = (now + ttl, value)
+    return value
+
+
+# Typed shapes of the backend responses we read: decoded straight from bytes,
+# missing fields take these defaults, unknown fields are ignored.
+class _WrappersResp(msgspec.Struct):
+    wrappers: Optional[list[Union[dict, str]]] = None
+
+
+class _QueryBudget(msgspec.Struct):
+    min_queries: int = 1
+    max_queries: int = 10
+    default_queries: int = 2
 
 
-def get_wrappers():
+class _ConfigResp(msgspec.Struct):
+    query_budget: _QueryBudget = msgspec.field(default_factory=_QueryBudget)
+
+
+_WRAPPERS_DECODER = msgspec.json.Decoder(_WrappersResp)
+_CONFIG_DECODER = msgspec.json.Decoder(_ConfigResp)
+
+
+def _fetch_wrappers(count_failure: bool = True):
+    r = _backend_call("GET", WRAPPERS_URL, "wrappers", count_failure=count_failure)
+    r.raise_for_status()
+    raw = _WRAPPERS_DECODER.decode(r.content).wrappers
+    if raw is None:
+        return _DEFAULT_WRAPPERS
+    if not raw:
+        return _PLAIN_DEFAULT_WRAPPERS
+    if isinstance(raw[0], dict):
+        return raw
+    return [{"id": w, "label": w, "description": ""} for w in raw]
+
+
+def get_wrappers(count_failure: bool = True):
     try:
-        r = requests.get(_backend_url("wrappers"), timeout=5)
-        if r.ok:
-            raw = r.json().get("wrappers", _DEFAULT_WRAPPERS)
-            if raw and isinstance(raw[0], dict):
-                return raw
-            return [{"id": w, "label": w, "description": ""} for w in (raw or ["noop", "keyword", "history", "query_budget"])]
+        return _cached("wrappers", CACHE_TTL, lambda: _fetch_wrappers(count_failure))
     except Exception:
-        pass
-    return _DEFAULT_WRAPPERS
+        return _DEFAULT_WRAPPERS
 
 
 @app.route("/")
 def index():
-    wrappers = get_wrappers()
-    min_q, max_q, default_q = get_query_budget_config()
-    return render_template(
-        "index.html",
-        wrappers=wrappers,
-        query_budget_min=min_q,
-        query_budget_max=max_q,
-        query_budget_default=default_q,
-    )
+    return _index_page(count_failure=True)
 
 
-def get_query_budget_config():
+def _index_page(count_failure: bool):
+    # Both fetches run in parallel; only the wrappers fetch may count a failure
+    wrappers_future = _IO_POOL.submit(get_wrappers, count_failure)
+    config_future = _IO_POOL.submit(get_query_budget_config, False)
+    wrappers = wrappers_future.result()
+    min_q, max_q, default_q = config_future.result()
+    # The page depends only on these values: keep the latest render with its
+    # etag (one cache entry) and let clients revalidate with If-None-Match
+    # (304, no body).
+    etag = hashlib.blake2b(repr((wrappers, min_q, max_q, default_q)).encode(), digest_size=8).hexdigest()
+    hit = _cache.get("index")
+    if hit is not None and hit[0] > time.monotonic() and hit[1][0] == etag:
+        html = hit[1][1]
+    else:
+        html = render_template(
+            "index.html",
+            wrappers=wrappers,
+            query_budget_min=min_q,
+            query_budget_max=max_q,
+            query_budget_default=default_q,
+        )
+        _cache["index"] = (time.monotonic() + CACHE_TTL, (etag, html))
+    response = make_response(html)
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def _fetch_query_budget_config(count_failure: bool = True):
+    r = _backend_call("GET", CONFIG_URL, "config", count_failure=count_failure)
+    r.raise_for_status()
+    qb = _CONFIG_DECODER.decode(r.content).query_budget
+    return qb.min_queries, qb.max_queries, qb.default_queries
+
+
+def get_query_budget_config(count_failure: bool = True):
     try:
-        r = requests.get(_backend_url("config"), timeout=5)
-        if r.ok:
-            qb = r.json().get("query_budget", {})
-            return qb.get("min_queries", 1), qb.get("max_queries", 10), qb.get("default_queries", 2)
+        return _cached("config", CACHE_TTL, lambda: _fetch_query_budget_config(count_failure))
     except Exception:
-        pass
-    return 1, 10, 2
+        return 1, 10, 2
+
+
+@app.route("/cache/clear", methods=["POST"])
+def clear_cache():
+    """Drop cached backend data so the next page load refetches it."""
+    _cache.clear()
+    return "", 204
+
+
+# Same body the backend returns for an empty prompt (SKIP, no model call)
+_EMPTY_PROMPT_RESPONSE = {
+    "final_output": "[Empty prompt]",
+    "wrapper_decision": "SKIP",
+    "decision_summary": "No prompt entered; no model call. No safety decision applied.",
+    "model_call_count": 0,
+    "raw_outputs": [],
+    "decisions_sequence": [],
+}
+
+
+_wrapper_ids: tuple = (None, frozenset())  # (wrappers list it was built from, ids)
+
+
+def _valid_wrapper_ids() -> frozenset:
+    """Wrapper ids from the cached /wrappers list; rebuilt only when that list changes."""
+    global _wrapper_ids
+    # The /query POST itself counts breaker failures, not this lookup
+    wrappers = get_wrappers(count_failure=False)
+    if _wrapper_ids[0] is not wrappers:
+        _wrapper_ids = (wrappers, frozenset(w.get("id") for w in wrappers))
+    return _wrapper_ids[1]
 
 
 @app.route("/query", methods=["POST"])
 def query():
-    data = request.get_json(force=True, silent=True) or {}
+    if not request.is_json:
+        return jsonify({"error": "expected application/json"}), 415
+    data = request.get_json(silent=True) or {}
     prompt = data.get("prompt", "")
     wrapper_name = data.get("wrapper_name", "noop")
     max_queries = data.get("max_queries")
+
+    # Answer requests the backend would not act on without a round trip
+    if not isinstance(prompt, str) or not prompt.strip():
+        return jsonify(_EMPTY_PROMPT_RESPONSE)
+    # null means "backend default wrapper": forward it unchanged
+    if wrapper_name is not None:
+        if not isinstance(wrapper_name, str):
+            return jsonify({"error": "wrapper_name must be a string"}), 400
+        if wrapper_name not in _valid_wrapper_ids():
+            return jsonify({"error": "unknown wrapper"}), 400
     payload = {"prompt": prompt, "wrapper_name": wrapper_name}
     if wrapper_name == "query_budget" and max_queries is not None:
+        min_q, max_q, _ = get_query_budget_config(count_failure=False)
+        try:
+            max_queries = int(max_queries)
+        except (TypeError, ValueError):
+            return jsonify({"error": "max_queries must be an integer"}), 400
+        if not min_q <= max_queries <= max_q:
+            return jsonify({"error": f"max_queries must be between {min_q} and {max_q}"}), 400
         payload["max_queries"] = max_queries
     try:
-        r = requests.post(
-            _backend_url("query"),
-            json=payload,
-            timeout=120,
-        )
-        r.raise_for_status()
-        return jsonify(r.json())
+        r = _backend_call("POST", QUERY_URL, "query", json=payload, stream=True)
+        try:
+            r.raise_for_status()
+        except requests.RequestException:
+            r.close()
+            raise
     except requests.RequestException as e:
         return jsonify({"error": str(e)}), 502
 
+    def relay():
+        # Backend bytes go straight to the client; closing returns the connection to the pool
+        with r:
+            yield from r.iter_content(chunk_size=16384)
+
+    headers = {}
+    # iter_content undoes any Content-Encoding, so the length only holds for identity bodies
+    if "Content-Length" in r.headers and "Content-Encoding" not in r.headers:
+        headers["Content-Length"] = r.headers["Content-Length"]
+    return Response(
+        stream_with_context(relay()),
+        status=r.status_code,
+        content_type=r.headers.get("Content-Type", "application/json"),
+        headers=headers,
+    )
+
+
+def _warm() -> None:
+    """
+    Open a pooled backend connection, fill the TTL caches and compile/render the
+    index template once, so the first real page load is served from cache.
+    Runs at import, i.e. once per gunicorn worker (preload_app is off).
+    """
+    try:
+        with app.test_request_context("/"):
+            # The backend may still be starting: do not count towards the breaker
+            _index_page(count_failure=False)
+    except Exception as e:  # never block startup; handlers fetch on demand
+        app.logger.warning("Startup warm-up failed: %s", e)
+
+
+_warm()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
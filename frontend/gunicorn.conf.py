@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the Flask frontend (production; Linux/macOS).
+From the project root: gunicorn -c frontend/gunicorn.conf.py frontend.app:app
+Every handler waits on the backend over HTTP, so gevent workers let each
+process keep many requests in flight. Dev server: python frontend/app.py.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gevent"
+# Shared with frontend/app.py, which sizes its connection pool from it
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", "1000"))
+# Keep False: the gevent worker monkey-patches before it imports the app, so
+# requests/urllib3 sockets in frontend.app are cooperative.
+preload_app = False